@@ -2,17 +2,21 @@
 # Setup and Environment Configuration
 #----------------------------------------------------------------------------------------------------
 
-from sqlalchemy import create_engine
-from shiny import App, render, ui
+from sqlalchemy import create_engine, text, LargeBinary
+from shiny import App, reactive, render, ui
 import pandas as pd
 import geopandas as gpd
-from shapely import wkt
+import shapely
 import folium
 from folium.plugins import MarkerCluster
-from matplotlib import cm, colors
+from folium.utilities import JsCode
+from matplotlib import colormaps, colors
 import numpy as np
-import plotly.express as px
+import plotly.graph_objects as go
 from shinywidgets import output_widget, render_widget
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 
@@ -30,86 +34,181 @@ db_name = os.getenv("DB_NAME")
 if not all([db_user, db_password, db_host, db_port, db_name]):
     raise ValueError("One or more environment variables are not set.")
 
-# Create the database engine
-engine = create_engine(f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
+# Database connection string
+CONN_STR = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+# Create a pooled database engine so the concurrent startup queries reuse open connections
+engine = create_engine(
+    CONN_STR,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=1800
+)
 
 
 #----------------------------------------------------------------------------------------------------
 # Data Fetching and Processing
 #----------------------------------------------------------------------------------------------------
 
-# Function to fetch houses and kingdoms data with explicit mapping
-def fetch_houses_and_kingdoms():
-    query = """
-    SELECT 
-        h.name AS house_name,
-        CASE
-            WHEN h.region IN ('The North', 'The Neck', 'Beyond the Wall') THEN 'The North'
-            WHEN h.region = 'The Vale' THEN 'The Vale'
-            WHEN h.region = 'Iron Islands' THEN 'Iron Islands'
-            WHEN h.region = 'The Riverlands' THEN 'The Riverlands'
-            WHEN h.region = 'The Westerlands' THEN 'The Westerlands'
-            WHEN h.region = 'The Stormlands' THEN 'The Stormlands'
-            WHEN h.region = 'The Crownlands' THEN 'The Crownlands'
-            WHEN h.region = 'The Reach' THEN 'The Reach'
-            WHEN h.region = 'Dorne' THEN 'Dorne'
-            ELSE 'Other Regions'
-        END AS kingdom_name
-    FROM 
-        got.houses h
-    """
-    df = pd.read_sql_query(query, engine)
-    df["house_name"] = df["house_name"].str.replace("^House ", "", regex=True)
-    df.columns = ["House Name", "Kingdom Name"]
-    return df
-
-# Fetch data for house count plot
-data_houses_kingdoms = fetch_houses_and_kingdoms()
-house_counts = data_houses_kingdoms.groupby("Kingdom Name").size().reset_index(name='Number of Houses')
-
-# Fetch data for population and area
+# Function to read a small aggregated result with a plain cursor on a pooled connection
+def fetch_aggregate(query):
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(query)
+        return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+# Query counting distinct house names (without the "House " prefix) for the overview
+query_total_houses = """
+SELECT 
+    COUNT(DISTINCT CASE WHEN left(h.name, 6) = 'House ' THEN substr(h.name, 7) ELSE h.name END) AS total_houses
+FROM got.houses h;
+"""
+
+# Query counting houses per kingdom in the database for the house count plot,
+# the full join keeps kingdoms without any houses with a count of zero
+query_house_counts = """
+SELECT 
+    COALESCE(rk.kingdom, 'Other Regions') AS "Kingdom Name",
+    COUNT(h.id) AS "Number of Houses"
+FROM got.houses h
+FULL JOIN got.region_to_kingdom rk ON rk.region = h.region
+GROUP BY 1
+ORDER BY 2 DESC, 1;
+"""
+
+# Queries for population and area
 query_population = """
 SELECT 
-    CASE 
-        WHEN h.region IN ('The North', 'The Neck', 'Beyond the Wall') THEN 'The North'
-        WHEN h.region = 'The Vale' THEN 'The Vale'
-        WHEN h.region = 'Iron Islands' THEN 'Iron Islands'
-        WHEN h.region = 'The Riverlands' THEN 'The Riverlands'
-        WHEN h.region = 'The Westerlands' THEN 'The Westerlands'
-        WHEN h.region = 'The Stormlands' THEN 'The Stormlands'
-        WHEN h.region = 'The Crownlands' THEN 'The Crownlands'
-        WHEN h.region = 'The Reach' THEN 'The Reach'
-        WHEN h.region = 'Dorne' THEN 'Dorne'
-        ELSE 'Other Regions'
-    END AS kingdom,
+    COALESCE(rk.kingdom, 'Other Regions') AS kingdom,
     COUNT(c.id) as total_population
 FROM got.characters c
 JOIN got.houses h ON h.id = ANY(c.allegiances)
-GROUP BY kingdom;
+LEFT JOIN got.region_to_kingdom rk ON rk.region = h.region
+GROUP BY 1;
 """
 
 query_area = """
 SELECT 
-    CASE 
-        WHEN k.name = 'The Neck' THEN 'The North'
-        WHEN k.name = 'The Crownlands' THEN 'The Crownlands'
-        ELSE k.name
-    END AS kingdom,
-    ST_Area(k.geog::geography) / 1000000 AS area_km2
-FROM atlas.kingdoms k;
+    COALESCE(rk.kingdom, k.name) AS kingdom,
+    SUM(ST_Area(k.geog::geography)) / 1000000 AS area_km2
+FROM atlas.kingdoms k
+LEFT JOIN got.region_to_kingdom rk ON rk.region = k.name
+GROUP BY 1;
 """
 
-# Load data into pandas DataFrames
-df_population = pd.read_sql_query(query_population, engine)
-df_area = pd.read_sql_query(query_area, engine)
+# Number of rows fetched per round trip when streaming large atlas queries
+STREAM_CHUNKSIZE = 10_000
+
+# Function to load the atlas layers for the map as GeoDataFrames
+def _load_atlas():
+    # Fetch data for the map over a pooled connection (WKB columns are typed so they arrive as bytes)
+    query_locations = text("""
+    SELECT gid, name, type, summary, ST_AsBinary(geog) as geom_wkb
+    FROM atlas.locations
+    """).columns(geom_wkb=LargeBinary)
+
+    query_kingdoms = text("""
+    SELECT gid, name, claimedby, summary, ST_AsBinary(geog) as geom_wkb
+    FROM atlas.kingdoms
+    """).columns(geom_wkb=LargeBinary)
+
+    query_houses = text("""
+    SELECT gid, name, type, summary, ST_AsBinary(geog) as geom_wkb
+    FROM atlas.locations
+    WHERE type IN ('Castle', 'City')
+    ORDER BY gid
+    """).columns(geom_wkb=LargeBinary)
+
+    with engine.connect() as conn:
+        kingdom_df = pd.read_sql_query(query_kingdoms, conn)
+
+        # Location row counts can grow, so stream them in chunks through a server-side cursor
+        conn = conn.execution_options(stream_results=True, yield_per=STREAM_CHUNKSIZE)
+        location_df = pd.concat(pd.read_sql_query(query_locations, conn, chunksize=STREAM_CHUNKSIZE), ignore_index=True)
+        houses_df = pd.concat(pd.read_sql_query(query_houses, conn, chunksize=STREAM_CHUNKSIZE), ignore_index=True)
+
+    # Convert WKB to geometries, parsing each column in a single vectorized call, and drop the raw bytes
+    location_df['geometry'] = shapely.from_wkb(location_df['geom_wkb'].values)
+    location_df.drop(columns=['geom_wkb'], inplace=True)
+    location_gdf = gpd.GeoDataFrame(location_df, geometry='geometry', crs='EPSG:4326')
+
+    kingdom_df['geometry'] = shapely.from_wkb(kingdom_df['geom_wkb'].values)
+    kingdom_df.drop(columns=['geom_wkb'], inplace=True)
+    kingdom_gdf = gpd.GeoDataFrame(kingdom_df, geometry='geometry', crs='EPSG:4326')
+
+    houses_df['geometry'] = shapely.from_wkb(houses_df['geom_wkb'].values)
+    houses_df.drop(columns=['geom_wkb'], inplace=True)
+    houses_gdf = gpd.GeoDataFrame(houses_df, geometry='geometry', crs='EPSG:4326')
+
+    # Assign random population values for demonstration, stable per gid since houses are ordered by gid
+    rng = np.random.default_rng(42)
+    houses_gdf['population'] = rng.integers(100, 5000, size=len(houses_gdf))
+
+    # Scale marker radius by population between 5 and 15
+    pop_min = houses_gdf['population'].min()
+    pop_max = houses_gdf['population'].max()
+    if pop_max > pop_min:
+        pop_scale = 10 / (pop_max - pop_min)
+        houses_gdf['radius'] = 5 + (houses_gdf['population'] - pop_min) * pop_scale
+    else:
+        houses_gdf['radius'] = 10
+
+    # Build the marker popup HTML for every row with vectorized string concatenation,
+    # filling missing values first so a single NULL doesn't turn the whole popup into NaN
+    location_summary = location_gdf['summary'].fillna('').replace('', 'No summary available.')
+    location_gdf['popup'] = (
+        "<b>Name:</b> " + location_gdf['name'].fillna('None').astype(str)
+        + "<br><b>Type:</b> " + location_gdf['type'].fillna('None').astype(str)
+        + "<br><b>Summary:</b> " + location_summary
+    )
+
+    houses_summary = houses_gdf['summary'].fillna('').replace('', 'No summary available.')
+    houses_gdf['popup'] = (
+        "<b>Name:</b> " + houses_gdf['name'].fillna('None').astype(str)
+        + "<br><b>Population:</b> " + houses_gdf['population'].astype(str)
+        + "<br><b>Type:</b> " + houses_gdf['type'].fillna('None').astype(str)
+        + "<br><b>Summary:</b> " + houses_summary
+    )
+
+    # Store the low-cardinality columns as categoricals
+    location_gdf['type'] = location_gdf['type'].astype('category')
+    houses_gdf['type'] = houses_gdf['type'].astype('category')
+    kingdom_gdf['claimedby'] = kingdom_gdf['claimedby'].astype('category')
+
+    return location_gdf, kingdom_gdf, houses_gdf
+
+# Run the independent loads concurrently, so startup waits for the slowest query rather than their sum.
+# The atlas is loaded once here since it is the same for every session and render.
+with ThreadPoolExecutor(max_workers=5) as executor:
+    future_total_houses = executor.submit(fetch_aggregate, query_total_houses)
+    future_house_counts = executor.submit(fetch_aggregate, query_house_counts)
+    future_population = executor.submit(fetch_aggregate, query_population)
+    future_area = executor.submit(fetch_aggregate, query_area)
+    future_atlas = executor.submit(_load_atlas)
+
+total_houses_count = future_total_houses.result()['total_houses'].iloc[0]
+house_counts = future_house_counts.result()
+df_population = future_population.result()
+df_area = future_area.result()
+_LOCATION_GDF, _KINGDOM_GDF, _HOUSES_GDF = future_atlas.result()
+
+# Store the kingdom columns as categoricals, they only hold a handful of distinct names
+df_population['kingdom'] = df_population['kingdom'].astype('category')
+df_area['kingdom'] = df_area['kingdom'].astype('category')
+
+# Center of the map when no kingdoms are shown
+_MAP_CENTER = _LOCATION_GDF.geometry.unary_union.centroid
 
 
 #----------------------------------------------------------------------------------------------------
 # UI Definition
 #----------------------------------------------------------------------------------------------------
 
+# Plot types offered in the sidebar
+plot_types = ["Bar Plot", "Pie Chart"]
+
 # Update the list of kingdoms to ensure it's consistent
-kingdom_list = sorted(set(df_population['kingdom']).union(set(data_houses_kingdoms['Kingdom Name'])))
+kingdom_list = sorted(set(df_population['kingdom']).union(set(house_counts['Kingdom Name'])))
 
 # Define the UI layout using ui.navset_tab and ui.nav_panel as positional arguments
 app_ui = ui.page_fluid(
@@ -117,7 +216,7 @@ app_ui = ui.page_fluid(
         ui.sidebar(
             ui.h3("Filters"),
             ui.input_selectize("kingdoms", "Select Kingdom(s)", choices=kingdom_list, multiple=True),
-            ui.input_select("plot_type", "Select Plot Type", ["Bar Plot", "Pie Chart"])
+            ui.input_select("plot_type", "Select Plot Type", plot_types)
         ),
         ui.navset_tab(
             ui.nav_panel(
@@ -141,13 +240,46 @@ app_ui = ui.page_fluid(
 # Server Logic and Plot Rendering
 #----------------------------------------------------------------------------------------------------
 
+# Kingdom color mapping
+kingdom_color_mapping = {
+    "The North": "#1f77b4", "The Reach": "#ff7f0e", "Dorne": "#2ca02c",
+    "The Westerlands": "#d62728", "The Riverlands": "#9467bd", "The Vale": "#8c564b",
+    "Iron Islands": "#e377c2", "The Stormlands": "#7f7f7f", "The Crownlands": "#ffff00",
+    "Gift": "#17becf", "Other Regions": "#b5b5b5"
+}
+
+# Function to build a bar or pie chart of a value per kingdom, constructing the trace directly from the columns
+def make_kingdom_plot(data, names, values, title, plot_type):
+    kingdoms = data[names].tolist()
+    kingdom_colors = [kingdom_color_mapping.get(kingdom, kingdom_color_mapping["Other Regions"]) for kingdom in kingdoms]
+    if plot_type == "Bar Plot":
+        fig = go.Figure(go.Bar(x=kingdoms, y=data[values].tolist(), marker_color=kingdom_colors))
+        fig.update_layout(xaxis_title=names, yaxis_title=values)
+    else:
+        fig = go.Figure(go.Pie(labels=kingdoms, values=data[values].tolist(), marker_colors=kingdom_colors))
+    fig.update_layout(title=title, height=400)
+    return fig
+
+# Build the unfiltered plots once at import, they are what every session shows until a kingdom is selected
+default_house_count_plots = {
+    plot_type: make_kingdom_plot(house_counts, 'Kingdom Name', 'Number of Houses', 'Number of Houses per Kingdom', plot_type)
+    for plot_type in plot_types
+}
+default_population_plots = {
+    plot_type: make_kingdom_plot(df_population, 'kingdom', 'total_population', 'Total Population by Kingdom', plot_type)
+    for plot_type in plot_types
+}
+default_area_plots = {
+    plot_type: make_kingdom_plot(df_area, 'kingdom', 'area_km2', 'Area of Kingdoms (km²)', plot_type)
+    for plot_type in plot_types
+}
+
 def server(input, output, session):
     # Total Houses
     @output
     @render.text
     def total_houses():
-        total = data_houses_kingdoms['House Name'].nunique()
-        return f"Total Houses: {total}"
+        return f"Total Houses: {total_houses_count}"
 
     # Total Population
     @output
@@ -156,237 +288,194 @@ def server(input, output, session):
         total = df_population['total_population'].sum()
         return f"Total Population: {total}"
 
-    # Kingdom color mapping
-    kingdom_color_mapping = {
-        "The North": "#1f77b4", "The Reach": "#ff7f0e", "Dorne": "#2ca02c",
-        "The Westerlands": "#d62728", "The Riverlands": "#9467bd", "The Vale": "#8c564b",
-        "Iron Islands": "#e377c2", "The Stormlands": "#7f7f7f", "The Crownlands": "#ffff00",
-        "Gift": "#17becf", "Other Regions": "#b5b5b5"
-    }
+    # Selected kingdoms, sorted so the same set of kingdoms always compares equal
+    @reactive.calc
+    def selected_kingdoms():
+        return tuple(sorted(input.kingdoms()))
+
+    # Filtered data, recomputed only when the selection changes and shared by the plots
+    @reactive.calc
+    def filtered_house_counts():
+        kingdoms = selected_kingdoms()
+        return house_counts[house_counts['Kingdom Name'].isin(kingdoms)] if kingdoms else house_counts
+
+    @reactive.calc
+    def filtered_population():
+        kingdoms = selected_kingdoms()
+        return df_population[df_population['kingdom'].isin(kingdoms)] if kingdoms else df_population
+
+    @reactive.calc
+    def filtered_area():
+        kingdoms = selected_kingdoms()
+        return df_area[df_area['kingdom'].isin(kingdoms)] if kingdoms else df_area
 
     # Update the house count plot
     @output
     @render_widget
     def house_count_plot():
-        selected_kingdoms = input.kingdoms()
-        filtered_data = house_counts[house_counts['Kingdom Name'].isin(selected_kingdoms)] if selected_kingdoms else house_counts
-        fig = px.bar(filtered_data, x='Kingdom Name', y='Number of Houses', color='Kingdom Name', title='Number of Houses per Kingdom',
-                     color_discrete_map=kingdom_color_mapping) if input.plot_type() == "Bar Plot" else px.pie(
-                     filtered_data, names='Kingdom Name', values='Number of Houses', color='Kingdom Name', title='Number of Houses per Kingdom',
-                     color_discrete_map=kingdom_color_mapping)
-        fig.update_layout(height=400)
-        return fig
+        if not selected_kingdoms():
+            return default_house_count_plots[input.plot_type()]
+        return make_kingdom_plot(filtered_house_counts(), 'Kingdom Name', 'Number of Houses',
+                                 'Number of Houses per Kingdom', input.plot_type())
 
     # Update the population plot
     @output
     @render_widget
     def population_plot():
-        selected_kingdoms = input.kingdoms()
-        filtered_data = df_population[df_population['kingdom'].isin(selected_kingdoms)] if selected_kingdoms else df_population
-        fig = px.bar(filtered_data, x='kingdom', y='total_population', color='kingdom', title='Total Population by Kingdom',
-                     color_discrete_map=kingdom_color_mapping) if input.plot_type() == "Bar Plot" else px.pie(
-                     filtered_data, names='kingdom', values='total_population', color='kingdom', title='Total Population by Kingdom',
-                     color_discrete_map=kingdom_color_mapping)
-        fig.update_layout(height=400)
-        return fig
+        if not selected_kingdoms():
+            return default_population_plots[input.plot_type()]
+        return make_kingdom_plot(filtered_population(), 'kingdom', 'total_population',
+                                 'Total Population by Kingdom', input.plot_type())
 
     # Update the area plot
     @output
     @render_widget
     def area_plot():
-        selected_kingdoms = input.kingdoms()
-        filtered_data = df_area[df_area['kingdom'].isin(selected_kingdoms)] if selected_kingdoms else df_area
-        fig = px.bar(filtered_data, x='kingdom', y='area_km2', color='kingdom', title='Area of Kingdoms (km²)',
-                     color_discrete_map=kingdom_color_mapping) if input.plot_type() == "Bar Plot" else px.pie(
-                     filtered_data, names='kingdom', values='area_km2', color='kingdom', title='Area of Kingdoms (km²)',
-                     color_discrete_map=kingdom_color_mapping)
-        fig.update_layout(height=400)
-        return fig
+        if not selected_kingdoms():
+            return default_area_plots[input.plot_type()]
+        return make_kingdom_plot(filtered_area(), 'kingdom', 'area_km2',
+                                 'Area of Kingdoms (km²)', input.plot_type())
+
+    # Update the map
+    @output
+    @render.ui
+    async def map():
+        # The selection is sorted, so the same set of kingdoms always hits the same cache entry
+        kingdoms = selected_kingdoms()
+        if not kingdoms:
+            return ui.HTML(_DEFAULT_MAP_HTML)
+        # Build the map in a worker thread so a cold build doesn't block other sessions
+        map_html = await asyncio.to_thread(_build_map_html, kingdoms)
+        return ui.HTML(map_html)
 
 
 #----------------------------------------------------------------------------------------------------
 # Map Rendering Logic
 #----------------------------------------------------------------------------------------------------
 
-    @output
-    @render.ui
-    def map():
-        selected_kingdoms = input.kingdoms()
-
-        # Fetch data for the map
-        query_locations = """
-        SELECT gid, name, type, summary, ST_AsText(geog) as geom_wkt
-        FROM atlas.locations
-        """
-        location_df = pd.read_sql_query(query_locations, engine)
-
-        query_kingdoms = """
-        SELECT gid, name, claimedby, summary, ST_AsText(geog) as geom_wkt
-        FROM atlas.kingdoms
-        """
-        kingdom_df = pd.read_sql_query(query_kingdoms, engine)
-
-        query_houses = """
-        SELECT gid, name, type, summary, ST_AsText(geog) as geom_wkt
-        FROM atlas.locations
-        WHERE type IN ('Castle', 'City')
-        """
-        houses_df = pd.read_sql_query(query_houses, engine)
-
-        # Convert WKT to geometries
-        location_df['geometry'] = location_df['geom_wkt'].apply(wkt.loads)
-        location_gdf = gpd.GeoDataFrame(location_df, geometry='geometry', crs='EPSG:4326')
-
-        kingdom_df['geometry'] = kingdom_df['geom_wkt'].apply(wkt.loads)
-        kingdom_gdf = gpd.GeoDataFrame(kingdom_df, geometry='geometry', crs='EPSG:4326')
-
-        houses_df['geometry'] = houses_df['geom_wkt'].apply(wkt.loads)
-        houses_gdf = gpd.GeoDataFrame(houses_df, geometry='geometry', crs='EPSG:4326')
-
-        # Assign random population values for demonstration
-        np.random.seed(42)
-        houses_gdf['population'] = np.random.randint(100, 5000, size=len(houses_gdf))
-
-        # Filter kingdoms based on selected kingdoms
-        if selected_kingdoms:
-            kingdom_gdf = kingdom_gdf[kingdom_gdf['name'].isin(selected_kingdoms)]
-        else:
-            selected_kingdoms = kingdom_gdf['name'].tolist()  # All kingdoms
-
-        # Assign colors to each kingdom using a colormap
-        n = len(kingdom_gdf)
-        if n > 0:
-            colormap = cm.get_cmap('rainbow', n)
-            kingdom_gdf['color'] = [colors.rgb2hex(colormap(i / n)) for i in range(n)]
-        else:
-            kingdom_gdf['color'] = 'gray'
-
-        # Calculate the center of the map
-        if not kingdom_gdf.empty:
-            center = kingdom_gdf.geometry.unary_union.centroid.coords[:][0]  # (lon, lat) tuple
-        else:
-            center = location_gdf.geometry.unary_union.centroid.coords[:][0]
-
-        # Create the folium map centered on the calculated centroid with tiles=None
-        m = folium.Map(
-            location=[center[1], center[0]],  # Folium uses [lat, lon]
-            zoom_start=5,
-            tiles=None  # Disable default tiles
+# Bind each marker's popup to the marker itself, the marker cluster never adds the GeoJson
+# group to the map so a popup bound on the group would never open
+_BIND_MARKER_POPUP = JsCode(
+    "function(feature, layer) { layer.bindPopup(feature.properties.popup, {maxWidth: 300}); }"
+)
+
+# Build the map HTML for a selection of kingdoms, cached per selection
+@functools.lru_cache(maxsize=32)
+def _build_map_html(selected_kingdoms: tuple) -> str:
+    location_gdf = _LOCATION_GDF
+    kingdom_gdf = _KINGDOM_GDF
+    houses_gdf = _HOUSES_GDF
+
+    # Filter kingdoms based on selected kingdoms (copied so the shared atlas is never modified)
+    if selected_kingdoms:
+        kingdom_gdf = kingdom_gdf[kingdom_gdf['name'].isin(selected_kingdoms)].copy()
+    else:
+        kingdom_gdf = kingdom_gdf.copy()
+        selected_kingdoms = kingdom_gdf['name'].tolist()  # All kingdoms
+
+    # Assign colors to each kingdom using a colormap
+    n = len(kingdom_gdf)
+    if n > 0:
+        rgba = colormaps['rainbow'].resampled(n)(np.arange(n))
+        kingdom_gdf['color'] = [colors.to_hex(c) for c in rgba]
+    else:
+        kingdom_gdf['color'] = 'gray'
+
+    # Calculate the center of the map
+    if not kingdom_gdf.empty:
+        center = kingdom_gdf.geometry.unary_union.centroid
+    else:
+        center = _MAP_CENTER
+
+    # Create the folium map centered on the calculated centroid with tiles=None
+    m = folium.Map(
+        location=[center.y, center.x],  # Folium uses [lat, lon]
+        zoom_start=5,
+        tiles=None  # Disable default tiles
+    )
+
+    # Add custom tile layer
+    folium.TileLayer(
+        tiles='https://cartocdn-gusc.global.ssl.fastly.net/ramirocartodb/api/v1/map/named/'
+              'tpl_756aec63_3adb_48b6_9d14_331c6cbc47cf/all/{z}/{x}/{y}.png',
+        attr='CartoDB',
+        name='CartoDB',
+        overlay=False,
+        control=False
+    ).add_to(m)
+
+    # Add polygons for kingdoms, passing only the columns the style, tooltip and popup read
+    folium.GeoJson(
+        kingdom_gdf[['name', 'claimedby', 'summary', 'color', 'geometry']],
+        name='Kingdoms',
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['color'],
+            'color': 'black',
+            'weight': 2,
+            'fillOpacity': 0.5,
+            'opacity': 1,
+        },
+        tooltip=folium.GeoJsonTooltip(
+            fields=['name', 'claimedby'],
+            aliases=['Name:', 'Claimed By:']
+        ),
+        popup=folium.GeoJsonPopup(
+            fields=['name', 'claimedby', 'summary'],
+            aliases=['Name:', 'Claimed By:', 'Summary:'],
+            max_width=300
         )
+    ).add_to(m)
+
+    # Define color and icon mappings
+    color_mapping = {
+        'Castle': 'red',
+        'City': 'blue',
+        'Fortress': 'green',
+        'Keep': 'orange',
+        # Add more types and colors as needed
+    }
 
-        # Add custom tile layer
-        folium.TileLayer(
-            tiles='https://cartocdn-gusc.global.ssl.fastly.net/ramirocartodb/api/v1/map/named/'
-                  'tpl_756aec63_3adb_48b6_9d14_331c6cbc47cf/all/{z}/{x}/{y}.png',
-            attr='CartoDB',
-            name='CartoDB',
-            overlay=False,
-            control=False
-        ).add_to(m)
-
-        # Add polygons for kingdoms
+    icon_mapping = {
+        'Castle': 'shield-alt',
+        'City': 'building',
+        'Fortress': 'archway',  # Ensure this icon is available in the free version
+        'Keep': 'home',
+        # Add more types and icons as needed
+    }
+
+    # Add one marker layer per location type with differentiated icons and colors
+    marker_cluster = MarkerCluster(name='Locations').add_to(m)
+    for location_type, group in location_gdf.groupby('type', observed=True, dropna=False):
+        # Use built-in Folium icons with Font Awesome
+        icon = folium.Icon(
+            icon=icon_mapping.get(location_type, 'info-circle'),
+            prefix='fa',
+            icon_color='white',
+            color=color_mapping.get(location_type, 'gray')
+        )
         folium.GeoJson(
-            kingdom_gdf,
-            name='Kingdoms',
-            style_function=lambda feature: {
-                'fillColor': feature['properties']['color'],
-                'color': 'black',
-                'weight': 2,
-                'fillOpacity': 0.5,
-                'opacity': 1,
-            },
-            tooltip=folium.GeoJsonTooltip(
-                fields=['name', 'claimedby'],
-                aliases=['Name:', 'Claimed By:']
-            ),
-            popup=folium.GeoJsonPopup(
-                fields=['name', 'claimedby', 'summary'],
-                aliases=['Name:', 'Claimed By:', 'Summary:'],
-                max_width=300
-            )
-        ).add_to(m)
-
-        # Define color and icon mappings
-        color_mapping = {
-            'Castle': 'red',
-            'City': 'blue',
-            'Fortress': 'green',
-            'Keep': 'orange',
-            # Add more types and colors as needed
-        }
-
-        icon_mapping = {
-            'Castle': 'shield-alt',
-            'City': 'building',
-            'Fortress': 'archway',  # Ensure this icon is available in the free version
-            'Keep': 'home',
-            # Add more types and icons as needed
-        }
-
-        # Add markers for locations with differentiated icons and colors
-        marker_cluster = MarkerCluster(name='Locations').add_to(m)
-        for idx, row in location_gdf.iterrows():
-            location_type = row['type']
-            marker_color = color_mapping.get(location_type, 'gray')
-            icon_name = icon_mapping.get(location_type, 'info-circle')
-
-            popup_content = f"""
-            <b>Name:</b> {row['name']}<br>
-            <b>Type:</b> {row['type']}<br>
-            <b>Summary:</b> {row['summary'] or 'No summary available.'}
-            """
-
-            # Use built-in Folium icons with Font Awesome
-            icon = folium.Icon(icon=icon_name, prefix='fa', icon_color='white', color=marker_color)
-
-            try:
-                folium.Marker(
-                    location=[row.geometry.y, row.geometry.x],
-                    popup=folium.Popup(popup_content, max_width=300),
-                    icon=icon
-                ).add_to(marker_cluster)
-            except ValueError:
-                folium.Marker(
-                    location=[row.geometry.y, row.geometry.x],
-                    popup=folium.Popup(popup_content, max_width=300),
-                    icon=folium.Icon(icon='info-circle', prefix='fa', icon_color='white', color='gray')
-                ).add_to(marker_cluster)
-
-        # Add markers for houses with population
-        houses_layer = folium.FeatureGroup(name='Houses').add_to(m)
-        pop_min = houses_gdf['population'].min()
-        pop_max = houses_gdf['population'].max()
-
-        def get_radius(pop):
-            if pop_max > pop_min:
-                return 5 + (pop - pop_min) / (pop_max - pop_min) * 10
-            else:
-                return 10
-
-        for idx, row in houses_gdf.iterrows():
-            pop = row['population']
-            radius = get_radius(pop)
-            popup_content = f"""
-            <b>Name:</b> {row['name']}<br>
-            <b>Population:</b> {pop}<br>
-            <b>Type:</b> {row['type']}<br>
-            <b>Summary:</b> {row['summary'] or 'No summary available.'}
-            """
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=radius,
-                color='blue',
-                fill=True,
-                fill_color='blue',
-                fill_opacity=0.6,
-                popup=folium.Popup(popup_content, max_width=300)
-            ).add_to(houses_layer)
-
-        # Add layer control
-        folium.LayerControl().add_to(m)
-
-        # Return the HTML representation of the map
-        return ui.HTML(m._repr_html_())
+            group[['popup', 'geometry']],
+            marker=folium.Marker(icon=icon),
+            on_each_feature=_BIND_MARKER_POPUP
+        ).add_to(marker_cluster)
+
+    # Add markers for houses with population as a single layer
+    folium.GeoJson(
+        houses_gdf[['radius', 'popup', 'geometry']],
+        name='Houses',
+        marker=folium.CircleMarker(color='blue', fill=True, fill_color='blue', fill_opacity=0.6),
+        style_function=lambda feature: {'radius': feature['properties']['radius']},
+        popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=300)
+    ).add_to(m)
+
+    # Add layer control
+    folium.LayerControl().add_to(m)
+
+    # Return the HTML representation of the map
+    return m._repr_html_()
+
+# Pre-render the unfiltered map at import, it is what every session shows first
+_DEFAULT_MAP_HTML = _build_map_html(())
 
 
 #----------------------------------------------------------------------------------------------------
@@ -397,5 +486,5 @@ def server(input, output, session):
 app = App(app_ui, server)
 
 # Run the app
-if __name__ == "main":
+if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -0,0 +1,5 @@
+-- Index house regions so joins against got.region_to_kingdom can use an index scan.
+-- Check the plan afterwards with EXPLAIN (ANALYZE, BUFFERS) on the house count query.
+CREATE INDEX IF NOT EXISTS idx_houses_region ON got.houses (region);
+
+ANALYZE got.houses;
@@ -0,0 +1,20 @@
+-- Lookup table mapping house regions to the kingdom they belong to.
+-- Regions that are not listed here are reported as 'Other Regions'.
+CREATE TABLE IF NOT EXISTS got.region_to_kingdom (
+    region  text PRIMARY KEY,
+    kingdom text NOT NULL
+);
+
+INSERT INTO got.region_to_kingdom (region, kingdom) VALUES
+    ('The North', 'The North'),
+    ('The Neck', 'The North'),
+    ('Beyond the Wall', 'The North'),
+    ('The Vale', 'The Vale'),
+    ('Iron Islands', 'Iron Islands'),
+    ('The Riverlands', 'The Riverlands'),
+    ('The Westerlands', 'The Westerlands'),
+    ('The Stormlands', 'The Stormlands'),
+    ('The Crownlands', 'The Crownlands'),
+    ('The Reach', 'The Reach'),
+    ('Dorne', 'Dorne')
+ON CONFLICT (region) DO UPDATE SET kingdom = EXCLUDED.kingdom;